@@ -30,12 +30,13 @@
 
 import csv
 import enum
+import functools
 from io import StringIO
 import sys
 import os
-from collections import deque
 import math
 import datetime as pydatetime
+import numpy
 import pandas
 
 convert_currency: bool = True
@@ -48,22 +49,25 @@ KAPINV_YEAR = '2018'
 assume_stock: bool = False
 
 eurusd = None
+eurusd_start = None
 
 eurusd_url: str = 'https://www.bundesbank.de/statistic-rmi/StatisticDownload?tsId=BBEX3.D.USD.EUR.BB.AC.000&its_csvFormat=en&its_fileFormat=csv&mode=its&its_from=2010'
 
-# Setup 'eurusd' as dict() to contain the EURUSD exchange rate on a given date
-# based on official data from bundesbank.de.
+# Setup 'eurusd' as dense numpy array to contain the EURUSD exchange rate
+# based on official data from bundesbank.de. The array is indexed by the
+# number of days since 'eurusd_start'. Days without data (weekends and
+# holidays) contain the last known exchange rate.
 # If the file 'eurusd.csv' does not exist, download the data from
 # the bundesbank directly.
 def read_eurusd() -> None:
     import csv
-    global eurusd
+    global eurusd, eurusd_start
     url = 'eurusd.csv'
     if not os.path.exists(url):
         url = os.path.join(os.path.dirname(__file__), 'eurusd.csv')
     if not os.path.exists(url):
         url = eurusd_url
-    eurusd = {}
+    rates = {}
     with open(url, encoding='UTF8') as csv_file:
         reader = csv.reader(csv_file)
         for _ in range(5):
@@ -71,21 +75,36 @@ def read_eurusd() -> None:
         for (date, usd, _) in reader:
             if date != '':
                 if usd != '.':
-                    eurusd[date] = float(usd)
+                    rates[pydatetime.date.fromisoformat(date)] = float(usd)
                 else:
-                    eurusd[date] = None
+                    rates[pydatetime.date.fromisoformat(date)] = numpy.nan
+    eurusd_start = min(rates)
+    eurusd = numpy.full((max(rates) - eurusd_start).days + 1, numpy.nan)
+    for (date, usd) in rates.items():
+        eurusd[(date - eurusd_start).days] = usd
+    eurusd = pandas.Series(eurusd).ffill().to_numpy()
 
 def get_eurusd(date: str) -> float:
-    while True:
-        try:
-            x = eurusd[date]
-        except KeyError:
-            print(f'ERROR: No EURUSD conversion data available for {date},'
-                ' please download newer data into the file eurusd.csv.')
-            sys.exit(1)
-        if x is not None:
-            return x
-        date = str(pydatetime.date(*map(int, date.split('-'))) - pydatetime.timedelta(days=1))
+    i = (pydatetime.date.fromisoformat(date) - eurusd_start).days
+    if i < 0 or i >= len(eurusd) or numpy.isnan(eurusd[i]):
+        print(f'ERROR: No EURUSD conversion data available for {date},'
+            ' please download newer data into the file eurusd.csv.')
+        sys.exit(1)
+    return float(eurusd[i])
+
+# Return the EURUSD exchange rates for all dates within the pandas
+# Series 'datetimes' at once.
+def get_eurusd_all(datetimes: pandas.Series) -> list[float]:
+    days = (datetimes.dt.normalize() - pandas.Timestamp(eurusd_start)).dt.days.to_numpy()
+    valid = (days >= 0) & (days < len(eurusd))
+    rates = numpy.full(len(days), numpy.nan)
+    rates[valid] = eurusd[days[valid]]
+    if numpy.isnan(rates).any():
+        date = datetimes[numpy.isnan(rates)].min().strftime('%Y-%m-%d')
+        print(f'ERROR: No EURUSD conversion data available for {date},'
+            ' please download newer data into the file eurusd.csv.')
+        sys.exit(1)
+    return rates.tolist()
 
 #def eur2usd(x: float, date: str, conv=None) -> float:
 #    if convert_currency:
@@ -101,8 +120,9 @@ def usd2eur(x: float, date: str, conv=None) -> float:
         return x / conv
     return x
 
+# NaN is the only value not equal to itself, no need to convert into a string:
 def isnan(x) -> bool:
-    return str(x) == 'nan'
+    return x != x
 
 class AssetType(enum.IntEnum):
     LongOption = 1
@@ -143,46 +163,91 @@ transaction_order = {
     'Long-Option': 15, 'Future': 16, 'Zinsen': 17, 'Ordergebühr': 18,
 }
 
+# Known values for 'Transaction Code' and 'Transaction Subcode':
+TCODES: frozenset[str] = frozenset(('Money Movement', 'Trade', 'Receive Deliver'))
+TSUBCODES_MONEY_MOVEMENT: frozenset[str] = frozenset(('Transfer', 'Deposit',
+    'Credit Interest', 'Balance Adjustment', 'Fee', 'Withdrawal', 'Dividend',
+    'Debit Interest', 'Mark to Market'))
+TSUBCODES_TRADE: frozenset[str] = frozenset(('Sell to Open', 'Buy to Close',
+    'Buy to Open', 'Sell to Close', 'Buy', 'Sell'))
+TSUBCODES_RECEIVE_DELIVER: frozenset[str] = frozenset(('Sell to Open', 'Buy to Close',
+    'Buy to Open', 'Sell to Close', 'Expiration', 'Assignment', 'Exercise',
+    'Forward Split', 'Reverse Split', 'Special Dividend', 'Dividend',
+    'Cash Settled Assignment', 'Cash Settled Exercise', 'Futures Settlement', 'Transfer'))
+
 def check_tcode(tcode, tsubcode, description):
-    if tcode not in ('Money Movement', 'Trade', 'Receive Deliver'):
+    if tcode not in TCODES:
         raise Exception(f'Unknown tcode: {tcode}')
     if tcode == 'Money Movement':
-        if tsubcode not in ('Transfer', 'Deposit', 'Credit Interest', 'Balance Adjustment',
-            'Fee', 'Withdrawal', 'Dividend', 'Debit Interest', 'Mark to Market'):
+        if tsubcode not in TSUBCODES_MONEY_MOVEMENT:
             raise ValueError(f'Unknown tsubcode for Money Movement: {tsubcode}')
         if tsubcode == 'Balance Adjustment' and description != 'Regulatory fee adjustment' \
             and description != 'Reg Fee Adjustment Frac Penny Adj to flatten balance' \
             and not description.startswith('Fee Correction'):
             raise ValueError(f'Unknown Balance Adjustment: {description}')
     elif tcode == 'Trade':
-        if tsubcode not in ('Sell to Open', 'Buy to Close', 'Buy to Open', 'Sell to Close', 'Buy', 'Sell'):
+        if tsubcode not in TSUBCODES_TRADE:
             raise ValueError(f'Unknown tsubcode: {tsubcode}')
     elif tcode == 'Receive Deliver':
-        if tsubcode not in ('Sell to Open', 'Buy to Close', 'Buy to Open', 'Sell to Close',
-            'Expiration', 'Assignment', 'Exercise', 'Forward Split', 'Reverse Split',
-            'Special Dividend', 'Dividend', 'Cash Settled Assignment', 'Cash Settled Exercise',
-            'Futures Settlement', 'Transfer'):
+        if tsubcode not in TSUBCODES_RECEIVE_DELIVER:
             raise ValueError(f'Unknown Receive Deliver tsubcode: {tsubcode}')
         if tsubcode == 'Assignment' and description != 'Removal of option due to assignment':
             raise ValueError(f'Assignment with description {description}')
         if tsubcode == 'Exercise' and description != 'Removal of option due to exercise':
             raise ValueError(f'Exercise with description {description}')
 
+BUYSELL: frozenset[str] = frozenset(('', 'Buy', 'Sell'))
+OPENCLOSE: frozenset[str] = frozenset(('', 'Open', 'Close'))
+CALLPUT: frozenset[str] = frozenset(('', 'C', 'P'))
+
 def check_param(buysell, openclose, callput):
-    if buysell not in ('', 'Buy', 'Sell'):
+    if buysell not in BUYSELL:
         raise ValueError(f'Unknown buysell: {buysell}')
-    if openclose not in ('', 'Open', 'Close'):
+    if openclose not in OPENCLOSE:
         raise ValueError(f'Unknown openclose: {openclose}')
-    if callput not in ('', 'C', 'P'):
+    if callput not in CALLPUT:
         raise ValueError(f'Unknown callput: {callput}')
 
+# Run the checks of check_tcode() and check_param() for all rows at once.
+# For the oldest invalid row the check functions are called to raise
+# the same error as if they had been called per row.
+def check_columns(wk):
+    tcode = wk['Transaction Code']
+    tsubcode = wk['Transaction Subcode']
+    description = wk['Description']
+    money_movement = tcode == 'Money Movement'
+    receive_deliver = tcode == 'Receive Deliver'
+    ok = ((money_movement & tsubcode.isin(TSUBCODES_MONEY_MOVEMENT)) |
+        ((tcode == 'Trade') & tsubcode.isin(TSUBCODES_TRADE)) |
+        (receive_deliver & tsubcode.isin(TSUBCODES_RECEIVE_DELIVER)))
+    ok &= ~(money_movement & (tsubcode == 'Balance Adjustment')) | \
+        description.isin(('Regulatory fee adjustment',
+        'Reg Fee Adjustment Frac Penny Adj to flatten balance')) | \
+        description.str.startswith('Fee Correction', na=False)
+    ok &= ~(receive_deliver & (tsubcode == 'Assignment')) | \
+        (description == 'Removal of option due to assignment')
+    ok &= ~(receive_deliver & (tsubcode == 'Exercise')) | \
+        (description == 'Removal of option due to exercise')
+    ok &= wk['Buy/Sell'].isin(BUYSELL) & wk['Open/Close'].isin(OPENCLOSE) & \
+        wk['Call/Put'].isin(CALLPUT)
+    if not ok.all():
+        row = wk.iloc[numpy.flatnonzero(~ok.to_numpy())[-1]]
+        check_tcode(row['Transaction Code'], row['Transaction Subcode'], row['Description'])
+        check_param(row['Buy/Sell'], row['Open/Close'], row['Call/Put'])
+        raise
+
+# Transactions where the amount is not checked against quantity and price:
+TSUBCODES_NO_AMOUNT_CHECK: frozenset[str] = frozenset(('Buy', 'Buy to Close',
+    'Buy to Open', 'Sell', 'Sell to Close', 'Sell to Open', 'Cash Settled Assignment',
+    'Cash Settled Exercise', 'Special Dividend', 'Dividend', 'Futures Settlement'))
+# Transactions without any amount:
+TSUBCODES_NO_AMOUNT: frozenset[str] = frozenset(('Expiration', 'Assignment', 'Exercise'))
+
 def check_trade(tsubcode, check_amount, amount, asset_type):
     #print('FEHLER:', check_amount, amount, tsubcode)
-    if tsubcode in ('Buy', 'Buy to Close', 'Buy to Open', 'Sell', 'Sell to Close', 'Sell to Open',
-        'Cash Settled Assignment', 'Cash Settled Exercise', 'Special Dividend', 'Dividend',
-        'Futures Settlement'):
+    if tsubcode in TSUBCODES_NO_AMOUNT_CHECK:
         pass
-    elif tsubcode not in ('Expiration', 'Assignment', 'Exercise'):
+    elif tsubcode not in TSUBCODES_NO_AMOUNT:
         if asset_type == AssetType.Crypto:
             if not math.isclose(check_amount, amount, abs_tol=0.01):
                 raise ValueError(f'Amount mismatch for Crypto: {check_amount} != {amount}')
@@ -266,10 +331,13 @@ NASDAQ100: tuple[str, ...] = (
     'ROP', 'ROST', 'SIRI', 'SPLK', 'SBUX', 'SNPS', 'TTWO', 'TMUS', 'TSLA',
     'TXN', 'TTD', 'VRSK', 'VRTX', 'WBA', 'WBD', 'WDAY', 'XEL', 'ZS')
 
-REITS: tuple[str, ...] = ('ARE', 'AMT', 'AVB', 'BXP', 'CPT', 'CBRE', 'CCI',
+REITS: frozenset[str] = frozenset(('ARE', 'AMT', 'AVB', 'BXP', 'CPT', 'CBRE', 'CCI',
     'DLR', 'DRE', 'EQUIX', 'EQR', 'ESS', 'EXR', 'FRT', 'PEAK', 'HST', 'INVH',
     'IRM', 'KIM', 'MAA', 'PLD', 'PSA', 'O', 'REG', 'SBAC', 'SPG', 'UDR',
-    'VTR', 'VICI', 'VNO', 'WELL', 'WY')
+    'VTR', 'VICI', 'VNO', 'WELL', 'WY'))
+
+# All well known individual stock names in one set for fast lookups:
+INDSTOCKS: frozenset[str] = frozenset(SP500 + SP500old + NASDAQ100)
 
 # Read all companies of the SP500 from wikipedia.
 def read_sp500() -> pandas.DataFrame:
@@ -303,26 +371,36 @@ def print_nasdaq100() -> None:
     print(p)
 
 
+# Well known ETFs (taxed as 'Aktienfond' starting with KAPINV_YEAR):
+ETFS: frozenset[str] = frozenset(('DIA', 'DXJ', 'EEM', 'EFA', 'EQQQ', 'EWW',
+    'EWZ', 'FEZ', 'FXB', 'FXE', 'FXI', 'GDX', 'GDXJ', 'IWM', 'IYR', 'KRE', 'OIH',
+    'QQQ', 'TQQQ', 'RSX', 'SMH', 'SPY', 'NOBL', 'UNG', 'XBI', 'XHB', 'XLB',
+    'XLE', 'XLF', 'XLI', 'XLK', 'XLP', 'XLU', 'XLV', 'XME', 'XOP', 'XRT', 'XLRE'))
+
+# Other ETFs (bonds, commodities, volatility):
+ETFS_OTHER: frozenset[str] = frozenset(('TLT', 'HYG', 'IEF', 'GLD', 'SLV',
+    'VXX', 'UNG', 'USO'))
+
 # Is the symbol a individual stock or anything else
 # like an ETF or fond?
+# The result only depends on the arguments, so it is cached for
+# each symbol. (Exceptions are not cached.)
+@functools.lru_cache(maxsize=None)
 def is_stock(symbol, tsubcode, cur_year):
     # Crypto assets like BTC/USD or ETH/USD:
     if symbol[-4:] == '/USD':
         return AssetType.Crypto
     # Well known ETFs:
-    if symbol in ('DIA','DXJ','EEM','EFA','EFA','EQQQ','EWW','EWZ','FEZ','FXB','FXE','FXI',
-        'GDX','GDXJ','IWM','IYR','KRE','OIH','QQQ','TQQQ',
-        'RSX','SMH','SPY','NOBL','UNG','XBI','XHB','XLB',
-        'XLE','XLF','XLI','XLK','XLP','XLU','XLV','XME','XOP','XRT','XLRE'):
+    if symbol in ETFS:
         if cur_year >= KAPINV_YEAR:
             return AssetType.AktienFond
         return AssetType.OtherStock
-    if symbol in ('TLT','HYG','IEF','GLD','SLV','VXX','UNG','USO'):
+    if symbol in ETFS_OTHER:
         return AssetType.OtherStock
     if symbol in REITS:
         return AssetType.ImmobilienFond
     # Well known individual stock names:
-    if (symbol in SP500 or symbol in SP500old or symbol in NASDAQ100): # and symbol not in REITS:
+    if symbol in INDSTOCKS: # and symbol not in REITS:
         return AssetType.IndStock
     if symbol.startswith('/'):
         if tsubcode not in ('Buy', 'Sell', 'Futures Settlement'):
@@ -336,52 +414,94 @@ def is_stock(symbol, tsubcode, cur_year):
     # Just assume this is a normal stock if not in the above list
     return AssetType.IndStock
 
-def sign(x):
-    if x >= 0:
-        return 1
-    return -1
-
 # return date of one year earlier:
+# (Cached, it is called for each change of the 'account-usd' FIFO and
+# all transactions of one day share the same date.)
+@functools.lru_cache(maxsize=None)
 def prev_year(date: str):
     if date is None:
         return None
     return str(int(date[:4]) - 1) + date[4:]
 
-# 'fifos' is a dictionary with 'asset' names. It contains a FIFO
-# 'deque()' with a list of 'price' (as float), 'price_usd' (as float),
-# 'quantity' (as integer), 'date' of purchase and 'tax_free'.
+# FIFO queue of open positions for one asset. Data is stored as
+# struct-of-arrays: one list each for 'price' (as float), 'price_usd'
+# (as float), 'quantity' (as integer, float for crypto), 'date' of
+# purchase and 'tax_free'. Removing the oldest entry only advances
+# 'head', consumed entries are dropped from time to time.
+class Fifo:
+    __slots__ = ('price', 'price_usd', 'quantity', 'date', 'tax_free', 'head')
+
+    def __init__(self):
+        self.price = []
+        self.price_usd = []
+        self.quantity = []
+        self.date = []
+        self.tax_free = []
+        self.head = 0
+
+    def __len__(self):
+        return len(self.quantity) - self.head
+
+    def __iter__(self):
+        return zip(self.price[self.head:], self.price_usd[self.head:],
+            self.quantity[self.head:], self.date[self.head:], self.tax_free[self.head:])
+
+    def append(self, price, price_usd, quantity, date, tax_free):
+        self.price.append(price)
+        self.price_usd.append(price_usd)
+        self.quantity.append(quantity)
+        self.date.append(date)
+        self.tax_free.append(tax_free)
+
+    def popleft(self):
+        self.head += 1
+        if self.head > 32 and self.head * 2 > len(self.quantity):
+            for column in (self.price, self.price_usd, self.quantity, self.date, self.tax_free):
+                del column[:self.head]
+            self.head = 0
+
+# 'fifos' is a dictionary with 'asset' names. It contains a 'Fifo()'
+# with all open positions for this asset.
 def fifo_add(fifos, quantity, price, price_usd, asset, date=None, tax_free=False, debug=False):
-    prevyear = prev_year(date)
     (pnl, pnl_notax) = (.0, .0)
     if quantity == 0:
         return (pnl, pnl_notax)
     if debug:
         #print_fifos(fifos)
         print('fifo_add', quantity, price, asset)
+    prevyear = prev_year(date)
     # Find the right FIFO queue for our asset:
-    if fifos.get(asset) is None:
-        fifos[asset] = deque()
-    fifo = fifos[asset]
+    fifo = fifos.get(asset)
+    if fifo is None:
+        fifo = fifos[asset] = Fifo()
+    # Local names for the FIFO columns, popleft() compacts them in place:
+    (fifo_price, fifo_quantity, fifo_date, fifo_tax_free) = \
+        (fifo.price, fifo.quantity, fifo.date, fifo.tax_free)
     # If the queue is empty, just add it to the queue:
-    while len(fifo) > 0:
+    while fifo.head < len(fifo_quantity):
+        # Index and quantity of the oldest FIFO entry:
+        i = fifo.head
+        q = fifo_quantity[i]
         # If we add assets into the same trading direction,
         # just add the asset into the queue. (Buy more if we are
         # already long, or sell more if we are already short.)
-        if sign(fifo[0][2]) == sign(quantity):
+        # (Zero counts as positive here.)
+        if (q >= 0) == (quantity >= 0):
             break
+        taxable = date is None or \
+            (fifo_date[i] > prevyear and quantity < 0 and
+            not fifo_tax_free[i] and not tax_free)
         # Here we start removing entries from the FIFO.
         # Check if the FIFO queue has enough entries for
         # us to finish:
-        if abs(fifo[0][2]) >= abs(quantity):
-            p = quantity * (price - fifo[0][0])
-            if date is None or \
-                (fifo[0][3] > prevyear and quantity < 0 and
-                not fifo[0][4] and not tax_free):
+        if abs(q) >= abs(quantity):
+            p = quantity * (price - fifo_price[i])
+            if taxable:
                 pnl -= p
             else:
                 pnl_notax -= p
-            fifo[0][2] += quantity
-            if fifo[0][2] == 0:
+            fifo_quantity[i] = q + quantity
+            if fifo_quantity[i] == 0:
                 fifo.popleft()
                 if len(fifo) == 0:
                     del fifos[asset]
@@ -389,31 +509,29 @@ def fifo_add(fifos, quantity, price, price_usd, asset, date=None, tax_free=False
         # Remove the oldest FIFO entry and continue
         # the loop for further entries (or add the
         # remaining entries into the FIFO).
-        p = fifo[0][2] * (price - fifo[0][0])
-        if date is None or \
-            (fifo[0][3] > prevyear and quantity < 0 and
-            not fifo[0][4] and not tax_free):
+        p = q * (price - fifo_price[i])
+        if taxable:
             pnl += p
         else:
             pnl_notax += p
-        quantity += fifo[0][2]
+        quantity += q
         fifo.popleft()
     # Just add this to the FIFO queue:
-    fifo.append([price, price_usd, quantity, date, tax_free])
+    fifo.append(price, price_usd, quantity, date, tax_free)
     return (pnl, pnl_notax)
 
 # Check if the first entry in the FIFO
 # is 'long' the underlying or 'short'.
 def fifos_islong(fifos, asset):
-    return fifos[asset][0][2] > 0
+    fifo = fifos[asset]
+    return fifo.quantity[fifo.head] > 0
 
 def fifos_sum_usd(fifos):
     sum_usd = .0
-    for fifo in fifos:
-        if fifo != 'account-usd':
-            #for (price, price_usd, quantity, date, tax_free) in fifos[fifo]:
-            for (_, price_usd, quantity, _, _) in fifos[fifo]:
-                sum_usd += price_usd * quantity
+    for fifo in fifos.values():
+        # only look at the two needed columns of the open entries:
+        for (price_usd, quantity) in zip(fifo.price_usd[fifo.head:], fifo.quantity[fifo.head:]):
+            sum_usd += price_usd * quantity
     return sum_usd
 
 # stock (and option) split
@@ -421,10 +539,11 @@ def fifos_split(fifos, asset, ratio):
     for fifo in fifos:
         # adjust stock for split:
         if fifo == asset:
-            for f in fifos[fifo]:
-                f[0] = f[0] / ratio
-                f[1] = f[1] / ratio
-                f[2] = f[2] * ratio
+            f = fifos[fifo]
+            for i in range(f.head, len(f.quantity)):
+                f.price[i] = f.price[i] / ratio
+                f.price_usd[i] = f.price_usd[i] / ratio
+                f.quantity[i] = f.quantity[i] * ratio
         # XXX: implement option strike adjustment
         # fifo == asset + ' ' + 'P/C' + Strike + ' '
 
@@ -435,9 +554,9 @@ def fifos_split(fifos, asset, ratio):
 
 # account-usd should always be the same as total together with
 # EURUSD conversion data. So just a sanity check:
-def check_total(fifos, total: float) -> None:
-    #for (price, price_usd, quantity, date, tax_free) in fifos['account-usd']:
-    for (_, _, quantity, _, _) in fifos['account-usd']:
+def check_total(usd_fifos, total: float) -> None:
+    #for (price, price_usd, quantity, date, tax_free) in usd_fifos['account-usd']:
+    for (_, _, quantity, _, _) in usd_fifos.get('account-usd', ()):
         total -= quantity / 10000
     if abs(total) > 0.004:
         print(total)
@@ -546,36 +665,34 @@ def get_summary(new_wk, orig_wk, tax_output, min_year, max_year):
         'KAP+KAP-INV', 'KAP+KAP-INV KErSt+Soli', 'KAP+KAP-INV Verlustvortrag',
         'Cash Balance USD', 'Net Liquidating Value', 'Net Liquidating Value EUR',
         'Time Weighted Return USD', 'Time Weighted Return EUR')
-    data = []
-    for _ in index:
-        data.append([.0] * len(years_total))
-    stats = pandas.DataFrame(data, columns=years_total, index=index)
+    # Sum up into plain dicts, setting single DataFrame cells with
+    # stats.loc[] for each transaction is very slow:
+    totals = {i: dict.fromkeys(years_total, .0) for i in index}
     now = pydatetime.datetime.now()
     curyear = now.year
     curdaysperyear = (now - pydatetime.datetime(curyear, 1, 1)).days * 5 // 7
     # check all transactions and record summary data per year:
-    for i in orig_wk.index:
-        if tax_output:
-            (date, type, pnl, eur_amount, usd_amount, fees, _, _, _, callput,
-                tax_free, usd_gains, usd_gains_notax, _, cash_total, net_total) = orig_wk.iloc[i]
-        else:
-            (date, type, pnl, eur_amount, usd_amount, fees, _, _, _, _, callput,
-                tax_free, usd_gains, usd_gains_notax, _, _, cash_total, net_total) = orig_wk.iloc[i]
+    net_totals = {}
+    for (date, cash_total, net_total) in zip(orig_wk.iloc[:, 0], orig_wk['USD Cash Total'],
+        orig_wk['Net-Total']):
         year = int(date[:4])
         # Cash und Net Total am Ende vom Jahr feststellen. Letzte Info ist Jahresende:
-        stats.loc['Cash Balance USD', year] = float(cash_total)
-        stats.loc['Net Liquidating Value', year] = float(net_total)
+        totals['Cash Balance USD'][year] = float(cash_total)
+        totals['Net Liquidating Value'][year] = net_totals[year] = float(net_total)
+    for (year, net_total) in net_totals.items():
         if year == curyear:
-            stats.loc['Net Liquidating Value EUR', year] = usd2eur(float(net_total), last_transaction_date)
+            totals['Net Liquidating Value EUR'][year] = usd2eur(net_total, last_transaction_date)
         else:
-            stats.loc['Net Liquidating Value EUR', year] = usd2eur(float(net_total), str(year) + '-12-31')
-    for i in new_wk.index:
+            totals['Net Liquidating Value EUR'][year] = usd2eur(net_total, str(year) + '-12-31')
+    # EURUSD exchange rate for each transaction:
+    conv_usd_all = get_eurusd_all(pandas.to_datetime(new_wk.iloc[:, 0]))
+    for (i, row) in enumerate(new_wk.itertuples(index=False, name=None)):
         if tax_output:
             (date, type, pnl, eur_amount, usd_amount, fees, _, _, _, callput,
-                tax_free, usd_gains, usd_gains_notax, _, cash_total, net_total) = new_wk.iloc[i]
+                tax_free, usd_gains, usd_gains_notax, _, cash_total, net_total) = row
         else:
             (date, type, pnl, eur_amount, usd_amount, fees, _, _, _, _, callput,
-                tax_free, usd_gains, usd_gains_notax, _, _, cash_total, net_total) = new_wk.iloc[i]
+                tax_free, usd_gains, usd_gains_notax, _, _, cash_total, net_total) = row
         year = int(date[:4])
         # steuerfreie Zahlungen:
         if type in ('Brokergebühr', 'Ordergebühr', 'Zinsen', 'Dividende', 'Dividende Aktienfond',
@@ -588,11 +705,11 @@ def get_summary(new_wk, orig_wk, tax_output, min_year, max_year):
             if bool(tax_free):
                 raise ValueError(f'tax_free is True for type "{type}". Full row: "{new_wk.iloc[i]}"')
         # Währungsgewinne:
-        stats.loc['Währungsgewinne USD', year] += float(usd_gains)
-        stats.loc['Währungsgewinne USD (steuerfrei)', year] += float(usd_gains_notax)
+        totals['Währungsgewinne USD'][year] += float(usd_gains)
+        totals['Währungsgewinne USD (steuerfrei)'][year] += float(usd_gains_notax)
         # sum of all fees paid:
-        stats.loc['Alle Gebühren in USD', year] += float(fees)
-        stats.loc['Alle Gebühren in Euro', year] += usd2eur(float(fees), date[:10])
+        totals['Alle Gebühren in USD'][year] += float(fees)
+        totals['Alle Gebühren in Euro'][year] += usd2eur(float(fees), date[:10], conv_usd_all[i])
         # PNL aufbereiten:
         if pnl == '':
             pnl = .0
@@ -601,58 +718,58 @@ def get_summary(new_wk, orig_wk, tax_output, min_year, max_year):
         # Die verschiedenen Zahlungen:
         if type == 'Ein/Auszahlung':
             if float(eur_amount) < .0:
-                stats.loc['Auszahlungen', year] += float(eur_amount)
-                stats.loc['Auszahlungen USD', year] += float(usd_amount)
+                totals['Auszahlungen'][year] += float(eur_amount)
+                totals['Auszahlungen USD'][year] += float(usd_amount)
             else:
-                stats.loc['Einzahlungen', year] += float(eur_amount)
-                stats.loc['Einzahlungen USD', year] += float(usd_amount)
+                totals['Einzahlungen'][year] += float(eur_amount)
+                totals['Einzahlungen USD'][year] += float(usd_amount)
         elif type == 'Brokergebühr':
-            stats.loc['Brokergebühren', year] += pnl
+            totals['Brokergebühren'][year] += pnl
         elif type in ('Aktienfond', 'Mischfond', 'Immobilienfond'):
             if pnl < .0:
-                stats.loc['Investmentfondsverluste', year] += pnl
+                totals['Investmentfondsverluste'][year] += pnl
             else:
-                stats.loc['Investmentfondsgewinne', year] += pnl
+                totals['Investmentfondsgewinne'][year] += pnl
         elif type == 'Krypto':
             if pnl < .0:
-                stats.loc['Krypto-Verluste', year] += pnl
+                totals['Krypto-Verluste'][year] += pnl
             else:
-                stats.loc['Krypto-Gewinne', year] += pnl
+                totals['Krypto-Gewinne'][year] += pnl
         elif type == 'Aktie':
             if pnl < .0:
-                stats.loc['Aktienverluste (Z23)', year] += pnl
+                totals['Aktienverluste (Z23)'][year] += pnl
             else:
-                stats.loc['Aktiengewinne (Z20)', year] += pnl
+                totals['Aktiengewinne (Z20)'][year] += pnl
         elif type == 'Sonstiges':
             if pnl < .0:
-                stats.loc['Sonstige Verluste', year] += pnl
+                totals['Sonstige Verluste'][year] += pnl
             else:
-                stats.loc['Sonstige Gewinne', year] += pnl
+                totals['Sonstige Gewinne'][year] += pnl
         elif type == 'Long-Option':
             if pnl < .0:
-                stats.loc['Long-Optionen-Verluste', year] += pnl
+                totals['Long-Optionen-Verluste'][year] += pnl
             else:
-                stats.loc['Long-Optionen-Gewinne', year] += pnl
+                totals['Long-Optionen-Gewinne'][year] += pnl
         elif type == 'Stillhalter-Option':
             if callput == 'C':
                 if pnl < .0:
-                    stats.loc['Stillhalter-Verluste Calls (FIFO)', year] += pnl
+                    totals['Stillhalter-Verluste Calls (FIFO)'][year] += pnl
                 else:
-                    stats.loc['Stillhalter-Gewinne Calls (FIFO)', year] += pnl
+                    totals['Stillhalter-Gewinne Calls (FIFO)'][year] += pnl
             else:
                 if pnl < .0:
-                    stats.loc['Stillhalter-Verluste Puts (FIFO)', year] += pnl
+                    totals['Stillhalter-Verluste Puts (FIFO)'][year] += pnl
                 else:
-                    stats.loc['Stillhalter-Gewinne Puts (FIFO)', year] += pnl
+                    totals['Stillhalter-Gewinne Puts (FIFO)'][year] += pnl
             if pnl < .0:
-                stats.loc['Stillhalter-Verluste (FIFO)', year] += pnl
+                totals['Stillhalter-Verluste (FIFO)'][year] += pnl
             else:
-                stats.loc['Stillhalter-Gewinne (FIFO)', year] += pnl
+                totals['Stillhalter-Gewinne (FIFO)'][year] += pnl
             eur_amount = float(eur_amount)
             if eur_amount < .0:
-                stats.loc['Stillhalter-Verluste', year] += eur_amount
+                totals['Stillhalter-Verluste'][year] += eur_amount
             else:
-                stats.loc['Stillhalter-Gewinne', year] += eur_amount
+                totals['Stillhalter-Gewinne'][year] += eur_amount
             # Kontrolle: Praemien sind alle steuerfrei, Glattstellungen nicht:
             if not bool(tax_free):
                 if eur_amount > .0:
@@ -661,42 +778,43 @@ def get_summary(new_wk, orig_wk, tax_output, min_year, max_year):
                 if eur_amount < .0:
                     raise AssertionError(f'Premium is tax free, assignments not. Found "{eur_amount}" EUR.')
         elif type == 'Ordergebühr':
-            stats.loc['zusätzliche Ordergebühren', year] += pnl
+            totals['zusätzliche Ordergebühren'][year] += pnl
         elif type == 'Dividende':
             if pnl < .0:
-                stats.loc['bezahlte Dividenden', year] += pnl
+                totals['bezahlte Dividenden'][year] += pnl
             else:
-                stats.loc['Dividenden', year] += pnl
+                totals['Dividenden'][year] += pnl
         elif type == 'Dividende Aktienfond':
             if pnl < .0:
-                stats.loc['bezahlte Dividenden', year] += pnl
+                totals['bezahlte Dividenden'][year] += pnl
             else:
-                stats.loc['Dividenden Aktienfond', year] += pnl
+                totals['Dividenden Aktienfond'][year] += pnl
         elif type == 'Dividende Mischfond':
             if pnl < .0:
-                stats.loc['bezahlte Dividenden', year] += pnl
+                totals['bezahlte Dividenden'][year] += pnl
             else:
-                stats.loc['Dividenden Mischfond', year] += pnl
+                totals['Dividenden Mischfond'][year] += pnl
         elif type == 'Dividende Immobilienfond':
             if pnl < .0:
-                stats.loc['bezahlte Dividenden', year] += pnl
+                totals['bezahlte Dividenden'][year] += pnl
             else:
-                stats.loc['Dividenden Immobilienfond', year] += pnl
+                totals['Dividenden Immobilienfond'][year] += pnl
         elif type == 'Quellensteuer':
-            stats.loc['Quellensteuer (Z41)', year] += pnl
+            totals['Quellensteuer (Z41)'][year] += pnl
         elif type == 'Zinsen':
             if pnl < .0:
-                stats.loc['Zinsausgaben', year] += pnl
+                totals['Zinsausgaben'][year] += pnl
             else:
-                stats.loc['Zinseinnahmen', year] += pnl
+                totals['Zinseinnahmen'][year] += pnl
         elif type == 'Future':
             if pnl < .0:
-                stats.loc['Future-Verluste', year] += pnl
+                totals['Future-Verluste'][year] += pnl
             else:
-                stats.loc['Future-Gewinne', year] += pnl
+                totals['Future-Gewinne'][year] += pnl
         else:
             print(type, i)
             raise
+    stats = pandas.DataFrame.from_dict(totals, orient='index')
     # add sums of data:
     for year in years:
         stats.loc['Währungsgewinne USD Gesamt', year] = \
@@ -902,9 +1020,8 @@ def append_open_positions(new_wk, tax_output, fifos):
     if tax_output:
         end = []
     for fifo in fifos:
-        if fifo != 'account-usd':
-            for (price, price_usd, quantity, date, tax_free) in fifos[fifo]:
-                out.append([date, quantity, fifo, '', f'{price:.2f}', 'Euro', f'{price_usd:.2f}', 'USD', '', '', '', '', ''] + end)
+        for (price, price_usd, quantity, date, tax_free) in fifos[fifo]:
+            out.append([date, quantity, fifo, '', f'{price:.2f}', 'Euro', f'{price_usd:.2f}', 'USD', '', '', '', '', ''] + end)
     dfnew = pandas.DataFrame(out, columns=new_wk.columns)
     return pandas.concat([new_wk, dfnew], ignore_index=True)
 
@@ -913,11 +1030,31 @@ def append_open_positions2(out, tax_output, fifos):
     if tax_output:
         end = []
     for fifo in fifos:
-        if fifo != 'account-usd':
-            for (price, price_usd, quantity, date, tax_free) in fifos[fifo]:
-                out.append([date, quantity, fifo, '', f'{price:.2f}', 'Euro', f'{price_usd:.2f}', 'USD', '', '', '', '', ''] + end)
+        for (price, price_usd, quantity, date, tax_free) in fifos[fifo]:
+            out.append([date, quantity, fifo, '', f'{price:.2f}', 'Euro', f'{price_usd:.2f}', 'USD', '', '', '', '', ''] + end)
     return out
 
+# Format all numbers within the list of transactions with two decimal
+# digits (four for the EURUSD exchange rate). 'GuV' can also be empty.
+def format_floats(df: pandas.DataFrame) -> pandas.DataFrame:
+    for (column, fmt) in (('GuV', '.2f'), ('Euro-Preis', '.2f'), ('USD-Preis', '.2f'),
+        ('USD-Gebühren', '.2f'), ('EurUSD', '.4f'), ('USD-Gewinne', '.2f'),
+        ('USD-Gewinne steuerneutral', '.2f'), ('USD-Gewinne Gesamt', '.2f'),
+        ('USD Cash Total', '.2f'), ('Net-Total', '.2f')):
+        df[column] = [x if x == '' else format(x, fmt) for x in df[column].tolist()]
+    return df
+
+# Columns of the report rows created in check(), with and without --tax-output:
+REPORT_COLUMNS: tuple[str, ...] = ('Datum/Zeit', 'Transaktions-Typ', 'GuV',
+    'Euro-Preis', 'USD-Preis', 'USD-Gebühren', 'EurUSD', 'Anzahl', 'Asset',
+    'Basiswert', 'callput',
+    'Steuerneutral', 'USD-Gewinne', 'USD-Gewinne steuerneutral', 'USD-Gewinne Gesamt',
+    'Beschreibung', 'USD Cash Total', 'Net-Total')
+REPORT_COLUMNS_TAX: tuple[str, ...] = ('Datum', 'Transaktions-Typ', 'GuV',
+    'Euro-Preis', 'USD-Preis', 'USD-Gebühren', 'EurUSD', 'Anzahl', 'Asset', 'callput',
+    'Steuerneutral', 'USD-Gewinne', 'USD-Gewinne steuerneutral', 'USD-Gewinne Gesamt',
+    'USD Cash Total', 'Net-Total')
+
 def check(all_wk, output_summary, output_csv, output_excel, tax_output, show, verbose, debug):
     if len(all_wk) == 1:
         wk = all_wk[0]
@@ -928,104 +1065,156 @@ def check(all_wk, output_summary, output_csv, output_excel, tax_output, show, ve
         wk.reset_index(drop=True, inplace=True)
     splits = {}               # save data for stock/option splits
     fifos = {}
+    usd_fifos = {}            # FIFO for currency gains of the USD account ('account-usd')
     cash_total = .0           # account cash total
+    sum_usd = .0              # USD value of all open positions, only changes with 'fifos'
     cur_year = None
     (min_year, max_year) = (0, 0)
     prev_datetime = None
     check_account_ref = None
     new_wk = []
-    for i in reversed(wk.index):
+    check_columns(wk)
+    # Check for empty (nan) fields once for the complete columns:
+    (symbol_nan, quantity_nan, expire_nan) = (wk[c].isna().tolist()
+        for c in ('Symbol', 'Quantity', 'Expiration Date'))
+    # Quantities with full numbers as int, pandas.NA for all others:
+    quantity_int = wk['Quantity'].where(wk['Quantity'] % 1 == 0).astype('Int64').tolist()
+    negative_price = wk['Price'] < .0
+    if negative_price.any():
+        raise ValueError(f'Price must be positive, but is {wk["Price"][negative_price].iloc[-1]}')
+    # EURUSD exchange rate for each transaction:
+    conv_usd_all = get_eurusd_all(wk['Date/Time'])
+    # Divisor to convert USD amounts into the report currency, 1.0 if the
+    # report stays in USD. This keeps the convert_currency check out of the loop:
+    conv_eur_all = conv_usd_all if convert_currency else [1.0] * len(conv_usd_all)
+    # Format all dates just once:
+    if (wk['Date/Time'].dt.second != 0).any() or (wk['Date/Time'].dt.microsecond != 0).any():
+        raise ValueError('Date/Time should only contain minutes, seconds must be zero.')
+    datetimes = wk['Date/Time'].dt.strftime('%Y-%m-%d %H:%M').tolist()
+    dates = wk['Date/Time'].dt.strftime('%Y-%m-%d').tolist()
+    years = wk['Date/Time'].dt.year.tolist()
+    # option/stock splits are tax neutral, so zero out amount/fees for it:
+    split = (wk['Transaction Code'] == 'Receive Deliver') & \
+        wk['Transaction Subcode'].isin(('Forward Split', 'Reverse Split'))
+    amounts = wk['Amount'].astype(float).mask(split, .0)
+    fees = wk['Fees'].astype(float).mask(split, .0)
+    if amounts.isna().any() or fees.isna().any():
+        raise ValueError('Amount and Fees must not be empty.')
+    # Amounts in the report currency and USD cash changes as big integer
+    # numbers for the 'account-usd' FIFO:
+    eur_amounts = ((amounts - fees).to_numpy() / numpy.array(conv_eur_all)).tolist()
+    (amounts_usd, fees_usd) = ((amounts * 10000).astype('int64').tolist(),
+        ((- fees) * 10000).astype('int64').tolist())
+    conv_usd_inv_all = (1 / numpy.array(conv_usd_all)).tolist()
+    # Accessing each row with 'wk.iloc[i]' creates a new pandas Series per row
+    # and is very slow. Extract all columns once as plain lists and index
+    # into them. 'Date/Time' is taken from the formatted strings, amount and
+    # fees are converted to float just once and all symbol names are interned,
+    # so dict lookups can compare by identity:
+    prepared = {
+        'Date/Time': datetimes,
+        'Symbol': [sys.intern(x) if isinstance(x, str) else x for x in wk['Symbol'].tolist()],
+        'Fees': fees.tolist(),
+        'Amount': amounts.tolist(),
+        'Price': wk['Price'].fillna(.0).tolist(),
+        # Option expiration as 'yy-mm-dd' for the asset names:
+        'Expiration Date': pandas.to_datetime(wk['Expiration Date'],
+            format='%m/%d/%Y').dt.strftime('%y-%m-%d').tolist(),
+    }
+    columns = [prepared[c] if c in prepared else wk[c].tolist() for c in wk.columns]
+    # Asset names for all option rows, e.g. 'SPY P400 24-03-15':
+    strike = wk['Strike']
+    whole = strike % 1 == 0 # convert to integer for full numbers
+    strikes = strike.astype(str)
+    strikes[whole] = strike[whole].astype('int64').astype(str)
+    option_assets = [sys.intern(x) if isinstance(x, str) else x for x in
+        (wk['Symbol'] + ' ' + wk['Call/Put'].astype(str) + strikes + ' ' +
+        pandas.Series(prepared['Expiration Date'], index=wk.index)).tolist()]
+    # look at currency conversion gains, find all tax free transactions:
+    tcode = wk['Transaction Code']
+    tsubcode = wk['Transaction Subcode']
+    description = wk['Description']
+    tax_free_all = (tsubcode.isin(('Credit Interest', 'Debit Interest', 'Dividend',
+            'Fee', 'Balance Adjustment', 'Special Dividend')) |
+        ((tsubcode == 'Deposit') & (description != 'ACH DEPOSIT') &
+            (description != 'Wire Funds Received')) |
+        ((tsubcode == 'Withdrawal') & (wk['Symbol'].notna() |
+            (description.str[:5] == 'FROM '))) |
+        # Stillhalterpraemien gelten als Zufluss und nicht als Anschaffung
+        # und sind daher steuer-neutral:
+        # XXX We use "Sell-to-Open" to find all "Stillhaltergeschäfte". This works
+        # ok for me, but what happens if we have one long option and sell two? Will
+        # Tastytrade split this into two transactions or keep this? With keeping this
+        # as one transaction, we should split the currency gains transaction as well.
+        # Could we detect this bad case within transactions?
+        ((tcode != 'Money Movement') & wk['Expiration Date'].notna() &
+            (wk['Buy/Sell'] == 'Sell') & (wk['Open/Close'] == 'Open'))).tolist()
+    # Build all row tuples at once, indexing a list is cheap in both directions:
+    rows = list(zip(*columns))
+    for i in range(len(wk) - 1, -1, -1):
         # Date/Time,Transaction Code,Transaction Subcode,Symbol,Buy/Sell,Open/Close,\
         #   Quantity,Expiration Date,Strike,Call/Put,Price,Fees,Amount,Description,\
         #   Account Reference
         if debug:
             print(wk.iloc[i].to_string())
         (datetime, tcode, tsubcode, symbol, buysell, openclose, quantity, expire, strike,
-            callput, price, fees, amount, description, account_ref) = wk.iloc[i]
-        if str(datetime)[16:] != ':00': # minimum output is minutes, seconds are 00 here
-            raise
-        datetime = str(datetime)[:16]
+            callput, price, fees, amount, description, account_ref) = rows[i]
+        # 'datetime' has minutes as minimum output, seconds are 00 here
         if prev_datetime is not None and prev_datetime > datetime:
             raise
         prev_datetime = datetime
-        date = datetime[:10] # year-month-day but no time
-        cur_year = datetime[:4]
-        if int(cur_year) > max_year:
+        date = dates[i] # year-month-day but no time
+        cur_year = date[:4]
+        year = years[i]
+        if year > max_year:
             # XXX print open positions for year cur_year if max_year != 0
             #new_wk = append_open_positions2(new_wk, tax_output, fifos)
-            max_year = int(cur_year)
-        if int(cur_year) < min_year or min_year == 0:
-            min_year = int(cur_year)
-        check_tcode(tcode, tsubcode, description)
-        check_param(buysell, openclose, callput)
+            max_year = year
+        if year < min_year or min_year == 0:
+            min_year = year
         if check_account_ref is None:
             check_account_ref = account_ref
         if len(all_wk) == 1 and account_ref != check_account_ref: # check if this does not change over time
             raise
-        (amount, fees) = (float(amount), float(fees))
-        # option/stock splits are tax neutral, so zero out amount/fees for it:
-        if tcode == 'Receive Deliver' and tsubcode in ('Forward Split', 'Reverse Split'):
-            (amount, fees) = (.0, .0)
-        conv_usd = get_eurusd(date)
+        conv_usd = conv_usd_all[i]
+        conv_eur = conv_eur_all[i]
         cash_total += amount - fees
-        eur_amount = usd2eur(amount - fees, date)
+        eur_amount = eur_amounts[i]
         # look at currency conversion gains:
-        tax_free = False
-        if tsubcode in ('Credit Interest', 'Debit Interest', 'Dividend',
-            'Fee', 'Balance Adjustment', 'Special Dividend'):
-            tax_free = True
-        if tsubcode == 'Deposit' and description != 'ACH DEPOSIT' and description != 'Wire Funds Received':
-            tax_free = True
-        if tsubcode == 'Withdrawal' and (not isnan(symbol) or description[:5] == 'FROM '):
-            tax_free = True
-        # Stillhalterpraemien gelten als Zufluss und nicht als Anschaffung
-        # und sind daher steuer-neutral:
-        # XXX We use "Sell-to-Open" to find all "Stillhaltergeschäfte". This works
-        # ok for me, but what happens if we have one long option and sell two? Will
-        # Tastytrade split this into two transactions or keep this? With keeping this
-        # as one transaction, we should split the currency gains transaction as well.
-        # Could we detect this bad case within transactions?
-        if tcode != 'Money Movement' and \
-            not isnan(expire) and buysell == 'Sell' and openclose == 'Open':
-            tax_free = True
+        tax_free = tax_free_all[i]
         # USD as a big integer number:
         if False:
             # Do not distinguish between price/amount and fees (which are alway tax free)
             # for currency gains:
-            (usd_gains, usd_gains_notax) = fifo_add(fifos, int((amount - fees) * 10000),
+            (usd_gains, usd_gains_notax) = fifo_add(usd_fifos, int((amount - fees) * 10000),
                 1 / conv_usd, 1, 'account-usd', date, tax_free)
             (usd_gains, usd_gains_notax) = (usd_gains / 10000.0, usd_gains_notax / 10000.0)
         else:
-            (usd_gains, usd_gains_notax) = fifo_add(fifos, int(amount * 10000),
-                1 / conv_usd, 1, 'account-usd', date, tax_free)
+            (usd_gains, usd_gains_notax) = fifo_add(usd_fifos, amounts_usd[i],
+                conv_usd_inv_all[i], 1, 'account-usd', date, tax_free)
             (usd_gains, usd_gains_notax) = (usd_gains / 10000.0, usd_gains_notax / 10000.0)
-            (usd_gains1, usd_gains_notax1) = fifo_add(fifos, int((- fees) * 10000),
-                1 / conv_usd, 1, 'account-usd', date, True)
+            (usd_gains1, usd_gains_notax1) = fifo_add(usd_fifos, fees_usd[i],
+                conv_usd_inv_all[i], 1, 'account-usd', date, True)
             (usd_gains1, usd_gains_notax1) = (usd_gains1 / 10000.0, usd_gains_notax1 / 10000.0)
             (usd_gains, usd_gains_notax) = (usd_gains + usd_gains1, usd_gains_notax + usd_gains_notax1)
 
         asset = ''
         newdescription = ''
 
-        if isnan(quantity):
+        if quantity_nan[i]:
             quantity = 1
         else:
             if tcode == 'Receive Deliver' and tsubcode in ('Forward Split', 'Reverse Split', 'Dividend'):
                 pass # splits might have further data, not quantity
-            elif int(quantity) != quantity:
+            elif quantity_int[i] is pandas.NA:
                 # Hardcode AssetType.Crypto here again:
                 if symbol[-4:] != '/USD':
                     raise
             else:
-                quantity = int(quantity)
-
-        if isnan(price):
-            price = .0
-        if price < .0:
-            raise ValueError(f'Price must be positive, but is {price}')
+                quantity = quantity_int[i]
 
         if tcode == 'Money Movement':
-            local_pnl = f'{eur_amount:.2f}'
+            local_pnl = eur_amount
             if tsubcode != 'Transfer' and fees != .0:
                 raise ValueError('Money Movement with fees')
             if tsubcode == 'Transfer' or (tsubcode == 'Deposit' and description == 'ACH DEPOSIT') or (tsubcode == 'Deposit' and description == 'Wire Funds Received'):
@@ -1034,7 +1223,7 @@ def check(all_wk, output_summary, output_csv, output_excel, tax_output, show, ve
                 newdescription = description
                 asset_type = AssetType.Transfer
             elif tsubcode in ('Deposit', 'Credit Interest', 'Debit Interest'):
-                if isnan(symbol):
+                if symbol_nan[i]:
                     asset = 'interest'
                     asset_type = AssetType.Interest
                     if description != 'INTEREST ON CREDIT BALANCE':
@@ -1064,7 +1253,7 @@ def check(all_wk, output_summary, output_csv, output_excel, tax_output, show, ve
                     if amount >= .0:
                         raise
             elif tsubcode == 'Withdrawal':
-                if not isnan(symbol):
+                if not symbol_nan[i]:
                     # XXX In my case: dividends paid for short stock:
                     asset = f'dividends paid for {symbol}'
                     asset_type = AssetType.Dividend
@@ -1110,6 +1299,7 @@ def check(all_wk, output_summary, output_csv, output_excel, tax_output, show, ve
                     ratio = int(ratio)
                 #print(symbol, quantity, oldquantity, ratio)
                 fifos_split(fifos, symbol, ratio)
+                sum_usd = fifos_sum_usd(fifos)
         elif tcode == 'Receive Deliver' and tsubcode in ('Exercise', 'Assignment') and symbol == 'SPX':
             # SPX Options already have a "Cash Settled Exercise/Assignment" tsubcode that handels all
             # trade relevant data. So we just delete this Exercise/Assignment line altogether.
@@ -1117,14 +1307,11 @@ def check(all_wk, output_summary, output_csv, output_excel, tax_output, show, ve
             pass
         else:
             asset = symbol
-            if not isnan(expire):
-                expire = pydatetime.datetime.strptime(expire, '%m/%d/%Y').strftime('%y-%m-%d')
+            if not expire_nan[i]:
                 price *= get_multiplier(asset)
-                if int(strike) == strike: # convert to integer for full numbers
-                    strike = int(strike)
-                asset = f'{symbol} {callput}{strike} {expire}'
+                asset = option_assets[i]
                 asset_type = AssetType.LongOption
-                if not isnan(expire) and ((buysell == 'Sell' and openclose == 'Open') or
+                if ((buysell == 'Sell' and openclose == 'Open') or
                     (buysell == 'Buy' and openclose == 'Close') or
                     (tsubcode in ('Expiration', 'Exercise', 'Assignment', 'Cash Settled Assignment', 'Cash Settled Exercise') and not fifos_islong(fifos, asset))):
                     asset_type = AssetType.ShortOption
@@ -1143,8 +1330,9 @@ def check(all_wk, output_summary, output_csv, output_excel, tax_output, show, ve
             #    quantity = 1.0
             check_trade(tsubcode, - (quantity * price), amount, asset_type)
             price_usd = abs((amount - fees) / quantity)
-            price = usd2eur(price_usd, date, conv_usd)
+            price = price_usd / conv_eur
             (local_pnl, _) = fifo_add(fifos, quantity, price, price_usd, asset)
+            sum_usd = fifos_sum_usd(fifos)
             if asset_type == AssetType.IndStock:
                 pass
             elif asset_type == AssetType.Future:
@@ -1164,9 +1352,8 @@ def check(all_wk, output_summary, output_csv, output_excel, tax_output, show, ve
                 #    elif asset_type == AssetType.ImmobilienFond:
                 #        local_pnl *= 0.20
             description = ''
-            local_pnl = f'{local_pnl:.2f}'
 
-        #check_total(fifos, cash_total)
+        #check_total(usd_fifos, cash_total)
 
         if cur_year >= KAPINV_YEAR and asset_type == AssetType.Dividend:
             div_type = is_stock(symbol, 'Buy', cur_year)
@@ -1180,67 +1367,68 @@ def check(all_wk, output_summary, output_csv, output_excel, tax_output, show, ve
                 #local_pnl = f'{float(local_pnl)*0.20:.2f}'
                 asset_type = AssetType.DividendImmobilienFond
 
-        net_total = cash_total + fifos_sum_usd(fifos)
+        net_total = cash_total + sum_usd
 
-        if local_pnl != '':
-            local_pnl = f'{float(local_pnl):.2f}'
+        # Numbers are stored as they are and only formatted after
+        # the loop with format_floats():
         if tax_output:
-            if datetime[:4] == tax_output:
-                new_wk.append([datetime[:10], transaction_type(asset_type), local_pnl,
-                        f'{eur_amount:.2f}', f'{amount - fees:.2f}', f'{fees:.2f}', f'{conv_usd:.4f}',
+            if cur_year == tax_output:
+                new_wk.append((date, transaction_type(asset_type), local_pnl,
+                        eur_amount, amount - fees, fees, conv_usd,
                         quantity, asset, callput,
-                        tax_free, f'{usd_gains:.2f}', f'{usd_gains_notax:.2f}', f'{usd_gains + usd_gains_notax:.2f}',
-                        f'{cash_total:.2f}', f'{net_total:.2f}'])
+                        tax_free, usd_gains, usd_gains_notax, usd_gains + usd_gains_notax,
+                        cash_total, net_total))
         else:
-            new_wk.append([datetime, transaction_type(asset_type), local_pnl,
-                f'{eur_amount:.2f}', f'{amount:.2f}', f'{fees:.2f}', f'{conv_usd:.4f}',
+            new_wk.append((datetime, transaction_type(asset_type), local_pnl,
+                eur_amount, amount, fees, conv_usd,
                 quantity, asset, symbol, callput,
-                tax_free, f'{usd_gains:.2f}', f'{usd_gains_notax:.2f}', f'{usd_gains + usd_gains_notax:.2f}',
-                newdescription, f'{cash_total:.2f}', f'{net_total:.2f}'])
+                tax_free, usd_gains, usd_gains_notax, usd_gains + usd_gains_notax,
+                newdescription, cash_total, net_total))
 
     #wk.drop('Account Reference', axis=1, inplace=True)
     if tax_output:
-        orig_wk = pandas.DataFrame(new_wk, columns=('Datum', 'Transaktions-Typ', 'GuV',
-            'Euro-Preis', 'USD-Preis', 'USD-Gebühren', 'EurUSD', 'Anzahl', 'Asset', 'callput',
-            'Steuerneutral', 'USD-Gewinne', 'USD-Gewinne steuerneutral', 'USD-Gewinne Gesamt',
-            'USD Cash Total', 'Net-Total'))
+        orig_wk = pandas.DataFrame(new_wk, columns=REPORT_COLUMNS_TAX)
+        orig_wk = format_floats(orig_wk)
         new_wk = sorted(new_wk, key=lambda x: transaction_order[x[1]])
-        new_wk = pandas.DataFrame(new_wk, columns=('Datum', 'Transaktions-Typ', 'GuV',
-            'Euro-Preis', 'USD-Preis', 'USD-Gebühren', 'EurUSD', 'Anzahl', 'Asset', 'callput',
-            'Steuerneutral', 'USD-Gewinne', 'USD-Gewinne steuerneutral', 'USD-Gewinne Gesamt',
-            'USD Cash Total', 'Net-Total'))
+        new_wk = pandas.DataFrame(new_wk, columns=REPORT_COLUMNS_TAX)
+        new_wk = format_floats(new_wk)
     else:
-        new_wk = pandas.DataFrame(new_wk, columns=('Datum/Zeit', 'Transaktions-Typ', 'GuV',
-            'Euro-Preis', 'USD-Preis', 'USD-Gebühren', 'EurUSD', 'Anzahl', 'Asset',
-            'Basiswert', 'callput',
-            'Steuerneutral', 'USD-Gewinne', 'USD-Gewinne steuerneutral', 'USD-Gewinne Gesamt',
-            'Beschreibung', 'USD Cash Total', 'Net-Total'))
+        new_wk = pandas.DataFrame(new_wk, columns=REPORT_COLUMNS)
+        new_wk = format_floats(new_wk)
         orig_wk = new_wk
     stats = get_summary(new_wk, orig_wk, tax_output, min_year, max_year)
     if tax_output:
         stats.drop('total', axis=1, inplace=True)
     print(stats.to_string())
     if output_summary:
-        with open(output_summary, 'w', encoding='UTF8') as f:
+        with open(output_summary, 'w', encoding='UTF8', newline='') as f:
             stats.to_csv(f)
     if show:
         show_plt(new_wk)
     if tax_output:
-        new_wk.drop('USD-Gebühren', axis=1, inplace=True)
-        new_wk.drop('USD Cash Total', axis=1, inplace=True)
-        new_wk.drop('Net-Total', axis=1, inplace=True)
+        new_wk.drop(['USD-Gebühren', 'USD Cash Total', 'Net-Total'], axis=1, inplace=True)
     new_wk = prepend_yearly_stats(new_wk, tax_output, stats, min_year, max_year)
     #new_wk = append_open_positions(new_wk, tax_output, fifos)
     new_wk.drop('callput', axis=1, inplace=True)
     if verbose:
         print(new_wk.to_string())
     if output_csv is not None:
-        with open(output_csv, 'w', encoding='UTF8') as f:
+        with open(output_csv, 'w', encoding='UTF8', newline='', buffering=1 << 20) as f:
             new_wk.to_csv(f, index=False)
     if output_excel is not None:
         with pandas.ExcelWriter(output_excel) as f:
             new_wk.to_excel(f, index=False, sheet_name='Tastytrade Report') #, engine='xlsxwriter')
 
+# Header of the legacy csv format and of the current csv format from Tastytrade:
+CSV_HEADER_LEGACY: tuple[str, ...] = ('Date/Time', 'Transaction Code',
+    'Transaction Subcode', 'Symbol', 'Buy/Sell', 'Open/Close', 'Quantity',
+    'Expiration Date', 'Strike', 'Call/Put', 'Price', 'Fees', 'Amount', 'Description',
+    'Account Reference')
+CSV_HEADER: tuple[str, ...] = ('Date', 'Type', 'Sub Type', 'Action', 'Symbol',
+    'Instrument Type', 'Description', 'Value', 'Quantity', 'Average Price', 'Commissions',
+    'Fees', 'Multiplier', 'Root Symbol', 'Underlying Symbol', 'Expiration Date',
+    'Strike Price', 'Call or Put', 'Order #', 'Total', 'Currency')
+
 def price_from_description(description: str) -> float:
     """
     Extract the price from the description string.
@@ -1256,11 +1444,14 @@ def price_from_description(description: str) -> float:
     price = float(parts[-1].strip())
     return price
 
-def transform_csv(csv_file: str) -> str:
+def transform_csv(csv_file: str) -> StringIO:
     """
     Transform the CSV file data from new data format back to the old data format.
+    Rows are converted one at a time and written into an in-memory csv file.
     """
-    transformed_data = 'Date/Time,Transaction Code,Transaction Subcode,Symbol,Buy/Sell,Open/Close,Quantity,Expiration Date,Strike,Call/Put,Price,Fees,Amount,Description,Account Reference'
+    transformed_data = StringIO()
+    writer = csv.writer(transformed_data, lineterminator='\n')
+    writer.writerow(CSV_HEADER_LEGACY)
     with open(csv_file, encoding='UTF8') as f:
         reader = csv.reader(f, delimiter=',')
         for row in reader:
@@ -1317,25 +1508,21 @@ def transform_csv(csv_file: str) -> str:
 
             account_refrerence = 'account'
 
-            transformed_data += f'\n{date},{transaction_code},{transaction_subcode},{symbol},{buy_sell},{open_close},{quantity},{expiration_date},{strike},{call_put},{price},{fees},{amount},{description},{account_refrerence}'
+            writer.writerow((date, transaction_code, transaction_subcode, symbol, buy_sell,
+                open_close, quantity, expiration_date, strike, call_put, price, fees, amount,
+                description, account_refrerence))
 
+    transformed_data.seek(0)
     return transformed_data
 
 def is_legacy_csv(csv_file) -> bool:
     """ Checks the first line of the csv data file if the header fits the legacy or the current format.
     """
-    header_legacy = 'Date/Time,Transaction Code,' + \
-    			'Transaction Subcode,Symbol,Buy/Sell,Open/Close,Quantity,' + \
-				'Expiration Date,Strike,Call/Put,Price,Fees,Amount,Description,' + \
-				'Account Reference\n'
-    header = 'Date,Type,Sub Type,Action,Symbol,Instrument Type,Description,Value,Quantity,' + \
-        		'Average Price,Commissions,Fees,Multiplier,Root Symbol,Underlying Symbol,Expiration Date,' + \
-                'Strike Price,Call or Put,Order #,Total,Currency\n'
     with open(csv_file, encoding='UTF8') as f:
-        content = f.readlines()
-    if content[0] == header_legacy:
+        header = tuple(next(csv.reader([f.readline()])))
+    if header == CSV_HEADER_LEGACY:
         legacy_format = True
-    elif content[0] == header:
+    elif header == CSV_HEADER:
         legacy_format = False
     else:
         print('ERROR: Wrong first line in csv file. Please download trade history from the Tastytrade app!')
@@ -1347,8 +1534,14 @@ def read_csv_tasty(csv_file: str) -> pandas.DataFrame:
     """
     csv_string = csv_file
     if not is_legacy_csv(csv_file):
-        csv_string = StringIO(transform_csv(csv_file))
-    wk = pandas.read_csv(csv_string, parse_dates=['Date/Time'])
+        csv_string = transform_csv(csv_file)
+    # Give explicit data types, so pandas does not need to guess them:
+    dtype = {'Transaction Code': 'category', 'Transaction Subcode': 'category',
+        'Symbol': 'str', 'Buy/Sell': 'str', 'Open/Close': 'str', 'Quantity': 'float64',
+        'Expiration Date': 'str', 'Strike': 'float64', 'Call/Put': 'str',
+        'Price': 'float64', 'Fees': 'float64', 'Amount': 'float64',
+        'Description': 'str', 'Account Reference': 'category'}
+    wk = pandas.read_csv(csv_string, dtype=dtype, parse_dates=['Date/Time'])
     #print(wk.info())
     #print(wk.head())
     #print(wk.memory_usage(deep=True))
@@ -1360,10 +1553,6 @@ def read_csv_tasty(csv_file: str) -> pandas.DataFrame:
         #print(wk[i].value_counts(dropna=False))
         wk[i] = wk[i].fillna('').astype('category')
         #print(wk[i].value_counts(dropna=False))
-    for i in ('Account Reference', 'Transaction Subcode', 'Transaction Code'):
-        #print(wk[i].value_counts(dropna=False))
-        wk[i] = wk[i].astype('category')
-        #print(wk[i].value_counts(dropna=False))
     #for i in ('Symbol', 'Expiration Date', 'Description'):
         #print(wk[i].value_counts(dropna=False))
         #wk[i] = wk[i].fillna('').astype('str')
@@ -1435,10 +1624,7 @@ def main(argv) -> None:
         usage()
         sys.exit()
     read_eurusd()
-    args.reverse()
-    all_wk = []
-    for csv_file in args:
-        all_wk.append(read_csv_tasty(csv_file))
+    all_wk = [read_csv_tasty(csv_file) for csv_file in reversed(args)]
     check(all_wk, output_summary, output_csv, output_excel, tax_output, show, verbose, debug)
 
 if __name__ == '__main__':